@@ -1,5 +1,7 @@
+import csv
 import re
 from collections import defaultdict
+from functools import lru_cache
 from typing import TypedDict, Dict, List, Tuple
 
 
@@ -15,6 +17,13 @@ class Qrel(TypedDict):
     label: int
 
 
+@lru_cache(maxsize=None)
+def load_spacy(model_name: str = 'en_core_web_sm'):
+    """Loads a spaCy pipeline on first use and shares it between callers."""
+    import spacy
+    return spacy.load(model_name)
+
+
 def load_queries(filepath: str, skip_header: bool = True) -> Dict[str, Query]:
     queries = {}
     with open(filepath, 'r') as f:
@@ -28,6 +37,13 @@ def load_queries(filepath: str, skip_header: bool = True) -> Dict[str, Query]:
     return queries
 
 
+def load_raw_queries(filepath: str) -> Dict[str, str]:
+    """Loads the utterances as written, without cleaning, for models trained
+    on raw text."""
+    with open(filepath, 'r', newline='') as f:
+        return {row['qid']: row['query'] for row in csv.DictReader(f)}
+
+
 def clean_query(query: str) -> str:
     query = re.sub(r'\W', ' ', query).lower().strip()
     return query
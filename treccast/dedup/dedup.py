@@ -0,0 +1,149 @@
+import hashlib
+import re
+import numpy as np
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Tuple
+
+SIMHASH_BITS = 64
+# Word unigrams without stopwords. Stopwords are shared by every passage and
+# would pull distinct passages on the same topic towards the same signature.
+SHINGLE_SIZE = 1
+# Above this the distance approaches that of unrelated passages (~32 bits)
+MAX_DISTANCE = SIMHASH_BITS // 4
+
+# SimHash signatures by docid, computed once per passage and shared between
+# all queries and reranking stages of a run.
+_signature_cache: Dict[str, int] = {}
+
+
+@lru_cache(maxsize=None)
+def stop_words() -> FrozenSet[str]:
+    from spacy.lang.en.stop_words import STOP_WORDS
+    return frozenset(STOP_WORDS)
+
+
+def simhash(text: str, shingle_size: int = SHINGLE_SIZE) -> int:
+    """Computes a 64 bit SimHash signature over the word shingles of a text,
+    ignoring stopwords."""
+    tokens = re.findall(r'\w+', text.lower())
+    # Fall back to all tokens for passages made up of stopwords only
+    tokens = [t for t in tokens if t not in stop_words()] or tokens
+    if len(tokens) > shingle_size:
+        shingles = [' '.join(tokens[i:i+shingle_size])
+                    for i in range(len(tokens) - shingle_size + 1)]
+    else:
+        shingles = [' '.join(tokens)]
+
+    hashes = np.array(
+        [hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest()
+         for s in shingles],
+        dtype='S8'
+    ).view(np.uint8).reshape(len(shingles), 8)
+
+    # One row of bits per shingle, summed as +1/-1 votes per bit position
+    bits = np.unpackbits(hashes, axis=1).astype(np.int32)
+    votes = (2 * bits - 1).sum(axis=0)
+    signature = np.packbits(votes > 0)
+    return int.from_bytes(signature.tobytes(), 'big')
+
+
+def get_signature(docid: str, passage: str) -> int:
+    if docid not in _signature_cache:
+        _signature_cache[docid] = simhash(passage)
+    return _signature_cache[docid]
+
+
+def collapse_duplicates(
+    rankings: Dict[str, Dict[str, float]],
+    docs: Dict[str, str],
+    max_distance: int = 3
+) -> Tuple[
+    Dict[str, Dict[str, float]],
+    Dict[str, Dict[str, List[str]]],
+    Dict[str, int]
+]:
+    """Collapses near-duplicate passages in each ranking into clusters.
+
+    Passages within max_distance bits (Hamming) of a cluster representative
+    join its cluster. The representative is the highest ranked passage of the
+    cluster, so only representatives need to be scored by the reranker.
+    Candidates are found by splitting signatures into max_distance + 1 bands,
+    so any pair within the distance shares at least one identical band.
+
+    Returns the rankings restricted to representatives, the clusters per query
+    (representative docid -> other members) and the number of saved
+    query-passage pairs per query.
+    """
+    if not 0 <= max_distance <= MAX_DISTANCE:
+        raise ValueError(f'max_distance must be between 0 and {MAX_DISTANCE}.')
+    n_bands = max_distance + 1
+    band_bits = SIMHASH_BITS // n_bands
+    band_mask = (1 << band_bits) - 1
+
+    collapsed_rankings = defaultdict(dict)
+    clusters = defaultdict(dict)
+    saved_pairs = {}
+    for qid, passages in rankings.items():
+        saved_pairs[qid] = 0
+        buckets = defaultdict(list)
+        for docid, score in passages.items():
+            signature = get_signature(docid, docs[docid])
+            bands = [(b, (signature >> (b * band_bits)) & band_mask)
+                     for b in range(n_bands)]
+
+            representative = None
+            for band in bands:
+                for rep_docid, rep_signature in buckets[band]:
+                    if bin(signature ^ rep_signature).count('1') <= max_distance:
+                        representative = rep_docid
+                        break
+                if representative is not None:
+                    break
+
+            if representative is not None:
+                clusters[qid][representative].append(docid)
+                saved_pairs[qid] += 1
+            else:
+                collapsed_rankings[qid][docid] = score
+                clusters[qid][docid] = []
+                for band in bands:
+                    buckets[band].append((docid, signature))
+
+    return collapsed_rankings, clusters, saved_pairs
+
+
+def expand_duplicates(
+    rankings: Dict[str, Dict[str, float]],
+    clusters: Dict[str, Dict[str, List[str]]],
+    mode: str = 'propagate'
+) -> Dict[str, Dict[str, float]]:
+    """Adds the collapsed cluster members back into reranked rankings.
+
+    With mode 'propagate' members get the score of their representative and
+    are placed right after it. With mode 'demote' members are placed below all
+    representatives, in the order of their representatives.
+    """
+    if mode not in ('propagate', 'demote'):
+        raise ValueError(f'Unknown dedup mode: {mode}')
+
+    expanded = defaultdict(dict)
+    for qid, passages in rankings.items():
+        if not passages:
+            continue
+        offset = 0.0
+        if mode == 'demote':
+            offset = max(passages.values()) - min(passages.values()) + 1.0
+
+        members = []
+        for docid, score in passages.items():
+            expanded[qid][docid] = score
+            for member in clusters[qid].get(docid, []):
+                if mode == 'propagate':
+                    expanded[qid][member] = score
+                else:
+                    members.append((member, score - offset))
+        for member, score in members:
+            expanded[qid][member] = score
+
+    return expanded
@@ -1,23 +1,20 @@
 import argparse
 import confuse
-import ir_measures
-import pandas as pd
+import os
 import pytz
-import re
+import sys
 from collections import defaultdict
 from datetime import datetime
-from elasticsearch import Elasticsearch
-from ir_measures import *
-from operator import itemgetter
 from pprint import pprint
-from tqdm import tqdm
-from typing import List, Dict, TypedDict, Tuple, Union
+from typing import TYPE_CHECKING, Any, List, Dict, Union
 
-from core.utils import load_queries, load_qrels, write_to_trec
-from reranker.reranker import run_reranker, fusion
-from retriever.retriever import get_passages
-from rewriter.rewriter import rewrite_queries
-from term_selector.term_selector import term_selector
+from core.utils import load_queries, load_raw_queries, load_qrels, write_to_trec
+
+if TYPE_CHECKING:
+    from elasticsearch import Elasticsearch
+
+# Heavy dependencies (ir_measures, Elasticsearch, transformers, torch, spaCy)
+# are imported on first use so that --help and --dry-run start instantly.
 
 
 CONFIG_PATH = 'config.yaml'
@@ -27,54 +24,170 @@ QRELS_PATH = 'data/qrels_train.txt'
 INDEX_NAME = 'ms_marco'
 
 
-def get_es():
-    return Elasticsearch()
+def get_es(host: str = 'localhost:9200') -> 'Elasticsearch':
+    from elasticsearch import Elasticsearch
+    return Elasticsearch(host)
+
+
+def get_tz(config: confuse.Configuration) -> pytz.BaseTzInfo:
+    name = config['tz'].get()
+    if not name:
+        raise confuse.ConfigValueError('tz must be set')
+    try:
+        return pytz.timezone(name)
+    except pytz.UnknownTimeZoneError:
+        raise confuse.ConfigValueError(f'unknown tz {name}')
+
+
+def get_dedup_max_distance(config: confuse.Configuration) -> int:
+    from dedup.dedup import MAX_DISTANCE
+
+    max_distance = config['dedup_max_distance'].get(int)
+    if not 0 <= max_distance <= MAX_DISTANCE:
+        raise confuse.ConfigValueError(
+            f'dedup_max_distance must be between 0 and {MAX_DISTANCE}, '
+            f'got {max_distance}'
+        )
+    return max_distance
+
+
+def get_dedup_mode(config: confuse.Configuration) -> str:
+    return config['dedup_mode'].as_choice(['propagate', 'demote', 'off'])
 
 
 def main(config):
-    train = False
-    if config['train'].get(bool):
-        train = True
-    if config['tz'].get():
-        tz = pytz.timezone(config['tz'].get())
+    if config['dry_run'].get(bool):
+        sys.exit(0 if dry_run(config) else 1)
+
     run(
-        train=train,
-        tz=tz
+        train=config['train'].get(bool),
+        tz=get_tz(config),
+        host=config['elasticsearch_host'].get(str),
+        dedup_mode=get_dedup_mode(config),
+        dedup_max_distance=get_dedup_max_distance(config)
     )
 
 
+def dry_run(config: confuse.Configuration) -> bool:
+    """Validates config, data files and Elasticsearch without loading any
+    models. Reports every problem and returns True if everything needed for a
+    full run is in place."""
+    ok = True
+
+    def check(passed: bool, message: str) -> None:
+        nonlocal ok
+        ok = ok and passed
+        print(f'[{"OK" if passed else "FAIL"}] {message}')
+
+    def check_config(name: str, parse) -> Any:
+        try:
+            value = parse()
+        except confuse.ConfigError as e:
+            check(False, f'Config {name}: {e}')
+            return None
+        check(True, f'Config {name}: {value}')
+        return value
+
+    # Config
+    train = check_config('train', lambda: config['train'].get(bool))
+    check_config('tz', lambda: get_tz(config))
+    host = check_config(
+        'elasticsearch_host', lambda: config['elasticsearch_host'].get(str))
+    check_config('dedup_mode', lambda: get_dedup_mode(config))
+    check_config('dedup_max_distance', lambda: get_dedup_max_distance(config))
+
+    # Data files
+    queries_path = QUERIES_PATH if train else QUERIES_TEST_PATH
+    if check_file(check, queries_path):
+        try:
+            queries = load_queries(queries_path)
+            check(
+                len(queries) > 0
+                and all(len(qid.split('_')) == 2 for qid in queries),
+                f'{len(queries)} queries with <topic>_<turn> ids'
+            )
+        except (IndexError, ValueError) as e:
+            check(False, f'Parsing {queries_path}: {e!r}')
+    if train and check_file(check, QRELS_PATH):
+        try:
+            qrels = load_qrels(QRELS_PATH)
+            check(len(qrels) > 0, f'Qrels for {len(qrels)} queries')
+        except (IndexError, ValueError) as e:
+            check(False, f'Parsing {QRELS_PATH}: {e!r}')
+    check(os.access('results', os.W_OK), 'Results folder is writable')
+
+    # Elasticsearch
+    if host is not None:
+        try:
+            es = get_es(host)
+            check(es.ping(), f'Elasticsearch reachable at {host}')
+            check(es.indices.exists(index=INDEX_NAME), f'Index {INDEX_NAME} exists')
+        except Exception as e:
+            check(False, f'Elasticsearch at {host}: {e}')
+
+    return ok
+
+
+def check_file(check, filepath: str) -> bool:
+    exists = os.path.isfile(filepath)
+    check(exists, f'Data file {filepath}')
+    return exists
+
+
 def run(
     train: bool,
-    tz: pytz.timezone
+    tz: pytz.timezone,
+    host: str = 'localhost:9200',
+    dedup_mode: str = 'propagate',
+    dedup_max_distance: int = 3
 ) -> None:
 
     # Load queries and QRELS
     if train:
         input_queries = load_queries(QUERIES_PATH)
+        raw_queries = load_raw_queries(QUERIES_PATH)
         qrels = load_qrels(QRELS_PATH)
     else:
         input_queries = load_queries(QUERIES_TEST_PATH)
+        raw_queries = load_raw_queries(QUERIES_TEST_PATH)
 
     # Run MVR
     run_mvr(
-        es=get_es(),
+        es=get_es(host),
         queries=input_queries,
+        raw_queries=raw_queries,
         tz=tz,
         train=train,
-        qrels=qrels if train else None
+        qrels=qrels if train else None,
+        dedup_mode=dedup_mode,
+        dedup_max_distance=dedup_max_distance
     )
 
     return
 
 
 def run_mvr(
-    es: Elasticsearch,
+    es: 'Elasticsearch',
     queries: Dict[str, str],
+    raw_queries: Dict[str, str],
     tz: pytz.timezone,
-    metrics: List[ir_measures] = [R(rel=2)@1000, nDCG@3, AP(rel=2), RR(rel=2)],
+    metrics: Union[List, None] = None,
     train: bool = False,
-    qrels: Union[Dict['str', Dict['str', 'int']], None] = None
+    qrels: Union[Dict['str', Dict['str', 'int']], None] = None,
+    dedup_mode: str = 'propagate',
+    dedup_max_distance: int = 3
 ):
+    import ir_measures
+    from ir_measures import R, nDCG, AP, RR
+
+    from dedup.dedup import collapse_duplicates, expand_duplicates
+    from reranker.reranker import run_reranker, fusion
+    from retriever.retriever import get_passages
+    from rewriter.rewriter import rewrite_queries, rewrite_queries_seq2seq
+    from term_selector.term_selector import term_selector
+
+    if metrics is None:
+        metrics = [R(rel=2)@1000, nDCG@3, AP(rel=2), RR(rel=2)]
     stage = 'TRAIN' if train else 'TEST'
 
     ##########################################################################
@@ -100,11 +213,30 @@ def run_mvr(
         print('First pass retrieval measures:')
         pprint(measures)
 
+    ##########################################################################
+    # Collapse near-duplicate passages before cross-encoder reranking
+    ##########################################################################
+    if dedup_mode == 'off':
+        candidate_rankings, clusters = first_pass_rankings, None
+    else:
+        candidate_rankings, clusters, saved_pairs = collapse_duplicates(
+            first_pass_rankings, docs, max_distance=dedup_max_distance)
+        n_pairs = sum(len(passages) for passages in first_pass_rankings.values())
+        print(f'Near-duplicate collapsing saved {sum(saved_pairs.values())} '
+              f'of {n_pairs} reranking pairs. Saved pairs per query:')
+        pprint(saved_pairs)
+
+    def rerank(queries_rerank: Dict[str, str]) -> Dict[str, Dict[str, float]]:
+        rankings = run_reranker(queries_rerank, candidate_rankings, docs)
+        if clusters is None:
+            return rankings
+        return expand_duplicates(rankings, clusters, mode=dedup_mode)
+
     ##########################################################################
     # STEP 2
     # Reranking queries+CTS with first-pass passages
     ##########################################################################
-    mvr_1_rankings = run_reranker(queries_cts, first_pass_rankings, docs)
+    mvr_1_rankings = rerank(queries_cts)
 
     # Write reranking results to file
     timestamp = datetime.now(tz).isoformat(timespec='seconds')
@@ -127,20 +259,29 @@ def run_mvr(
     ##########################################################################
     top_k_docs = 2
     docs_to_cts = []
-    for qid, passages in mvr_1_rankings.items():
-        for i, (docid, _) in enumerate(passages.items()):
-            if i >= top_k_docs:
+    cts_doc_indices = defaultdict(list)
+    for qid in queries:
+        # Skip collapsed copies so the top passages are distinct
+        members = set()
+        if clusters is not None:
+            members = {d for copies in clusters[qid].values() for d in copies}
+        for docid in mvr_1_rankings.get(qid, {}):
+            if len(cts_doc_indices[qid]) >= top_k_docs:
                 break
+            if docid in members:
+                continue
+            cts_doc_indices[qid].append(len(docs_to_cts))
             docs_to_cts.append(docs[docid])
     doc_cts = term_selector(docs_to_cts)
 
+    # Merge the terms of each query's passages, one entry per query
     merged_cts = []
-    for i in range(0, len(doc_cts), top_k_docs):
+    for qid in queries:
         merged_cts.append(
-            ' '.join(set(d for sublist in doc_cts[i:i+top_k_docs] for d in sublist)))
+            ' '.join(set(d for i in cts_doc_indices[qid] for d in doc_cts[i])))
 
     queries_cts = rewrite_queries(queries, merged_cts)
-    mvr_2_rankings = run_reranker(queries_cts, mvr_1_rankings, docs)
+    mvr_2_rankings = rerank(queries_cts)
 
     # Write reranking results to file
     timestamp = datetime.now(tz).isoformat(timespec='seconds')
@@ -159,15 +300,32 @@ def run_mvr(
 
     ##########################################################################
     # STEP 4
-    # Reranking based on query reformulation (GPT2)
+    # Reranking based on query reformulation (T5 CANARD)
     ##########################################################################
-    # TODO
+    # The rewriter gets the raw utterances, the cleaned ones are for BM25
+    queries_rewritten = rewrite_queries_seq2seq(raw_queries)
+    mvr_3_rankings = rerank(queries_rewritten)
+
+    # Write reranking results to file
+    timestamp = datetime.now(tz).isoformat(timespec='seconds')
+    filepath_out_trec = f'results/{timestamp}-MVR3-reranked-{stage}.trec'
+    write_to_trec(filepath_out_trec, mvr_3_rankings, train=train)
+
+    # Print measures
+    if train:
+        measures = ir_measures.calc_aggregate(
+            metrics,
+            qrels,
+            ir_measures.read_trec_run(filepath_out_trec)
+        )
+        print('MVR3 reranking measures:')
+        pprint(measures)
 
     ##########################################################################
     # STEP 5
     # Fuse results (simple addition of scores) and sort
     ##########################################################################
-    mvr_rankings = fusion([mvr_1_rankings, mvr_2_rankings])
+    mvr_rankings = fusion([mvr_1_rankings, mvr_2_rankings, mvr_3_rankings])
 
     # Write reranking results to file
     timestamp = datetime.now(tz).isoformat(timespec='seconds')
@@ -202,6 +360,13 @@ def parse_args() -> argparse.Namespace:
         const=True,
         help='Score the train dataset. Defaults to False.'
     )
+    parser.add_argument(
+        '-n',
+        '--dry-run',
+        action='store_const',
+        const=True,
+        help='Validate config, data files and Elasticsearch without loading models.'
+    )
     return parser.parse_args()
 
 
@@ -1,11 +1,4 @@
-import pandas as pd
-from regex import P
-import torch
-import torch.nn.functional as F
 from collections import defaultdict
-from datasets import Dataset
-from sentence_transformers import SentenceTransformer, util, CrossEncoder
-from transformers import pipeline, AutoTokenizer, AutoModelForQuestionAnswering, AutoModelForSequenceClassification
 from tqdm import tqdm
 from typing import List, Dict, Tuple
 
@@ -17,6 +10,8 @@ def run_reranker(
     model_name: str = 'cross-encoder/ms-marco-MiniLM-L-12-v2'  # Fusion nDCG@3 = 0.222 SLOW
 ) -> Dict[str, Dict[str, float]]:
 
+    from sentence_transformers import CrossEncoder
+
     model = CrossEncoder(model_name, max_length=512)
     
     rerankings = defaultdict(dict)
@@ -1,8 +1,15 @@
-import spacy
+import fcntl
+import hashlib
+import json
+import os
 from collections import defaultdict
+from tqdm import tqdm
 from typing import List, Dict
 
-nlp = spacy.load('en_core_web_sm')
+from core.utils import load_spacy
+
+REWRITE_CACHE_PATH = 'cache/rewrites.json'
+HISTORY_SEPARATOR = ' ||| '
 
 
 def rewrite_queries(
@@ -51,7 +58,7 @@ def rewrite_queries_spacy(queries: List[Dict[str, str]]) -> List[Dict[str, str]]
             rewritten_query = ''
         conversational_terms = []
         if len(rewritten_query) > 0:
-            doc = nlp(rewritten_query)
+            doc = load_spacy()(rewritten_query)
 
             conversational_terms = [
                 token.text for token in doc if token.tag_ in [
@@ -65,3 +72,132 @@ def rewrite_queries_spacy(queries: List[Dict[str, str]]) -> List[Dict[str, str]]
 
     return rewritten_queries
 
+
+def load_rewrite_cache(filepath: str = REWRITE_CACHE_PATH) -> Dict[str, Dict[str, str]]:
+    if not os.path.exists(filepath):
+        return {}
+    with open(filepath, 'r') as f:
+        return json.load(f)
+
+
+def save_rewrite_cache(
+        cache_key: str,
+        rewrites: Dict[str, str],
+        filepath: str = REWRITE_CACHE_PATH
+) -> None:
+    """Merges new rewrites into the cache file.
+
+    The file is re-read under an exclusive lock right before it is replaced,
+    so concurrent runs keep each other's entries.
+    """
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(f'{filepath}.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        cache = load_rewrite_cache(filepath)
+        cache.setdefault(cache_key, {}).update(rewrites)
+        tmp_filepath = f'{filepath}.{os.getpid()}.tmp'
+        with open(tmp_filepath, 'w') as f:
+            json.dump(cache, f, indent=1)
+        os.replace(tmp_filepath, filepath)
+
+
+def history_hash(history: str) -> str:
+    return hashlib.sha1(history.encode('utf-8')).hexdigest()
+
+
+def build_histories(
+        queries: Dict[str, str],
+        n_previous_turns: int = None
+) -> Dict[str, str]:
+    """Builds the model input for every turn: the previous utterances of the
+    topic followed by the current one, joined with the CANARD separator."""
+    histories = {}
+    current_topic_number = None
+    utterances = []
+
+    for qid, query in queries.items():
+        topic_number, turn_number = qid.split('_')
+
+        if not current_topic_number == topic_number:
+            current_topic_number = topic_number
+            utterances = []
+
+        utterances.append(query)
+        context = utterances if n_previous_turns is None \
+            else utterances[-(n_previous_turns + 1):]
+        histories[qid] = HISTORY_SEPARATOR.join(context)
+    return histories
+
+
+def rewrite_queries_seq2seq(
+        queries: Dict[str, str],
+        model_name: str = 'castorini/t5-base-canard',
+        batch_size: int = 16,
+        num_beams: int = 1,
+        max_length: int = 64,
+        n_previous_turns: int = None,
+        device: str = 'cpu',
+        cache_path: str = REWRITE_CACHE_PATH
+) -> Dict[str, str]:
+    """Rewrites conversational queries into self-contained ones with a seq2seq
+    model fed with the topic history. Expects the raw utterances, as the model
+    was trained on text with its original casing and punctuation.
+
+    All turns are generated in batches, and rewrites are persisted in a cache
+    keyed by model name, decoding settings and history hash, so only unseen
+    histories reach the model. The model is not loaded at all when every
+    rewrite is cached.
+    """
+    histories = build_histories(queries, n_previous_turns=n_previous_turns)
+
+    # Rewrites depend on the decoding settings as well as the model
+    cache_key = f'{model_name}|beams={num_beams}|len={max_length}'
+    model_cache = load_rewrite_cache(cache_path).get(cache_key, {})
+
+    # Unique histories not yet rewritten by this model
+    missing = {}
+    for history in histories.values():
+        key = history_hash(history)
+        if key not in model_cache:
+            missing[key] = history
+
+    if missing:
+        import torch
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name).to(device)
+        model.eval()
+
+        # Sort by length to minimize padding within each batch
+        pending = sorted(missing.items(), key=lambda x: len(x[1]))
+        new_rewrites = {}
+        with torch.inference_mode():
+            for i in tqdm(range(0, len(pending), batch_size), desc='Rewriting'):
+                batch = pending[i:i+batch_size]
+                inputs = tokenizer(
+                    [history for (_, history) in batch],
+                    padding=True,
+                    truncation=True,
+                    max_length=512,
+                    return_tensors='pt'
+                ).to(device)
+                outputs = model.generate(
+                    **inputs,
+                    num_beams=num_beams,
+                    do_sample=False,
+                    max_length=max_length,
+                    use_cache=True
+                )
+                rewrites = tokenizer.batch_decode(
+                    outputs, skip_special_tokens=True)
+                for (key, _), rewrite in zip(batch, rewrites):
+                    new_rewrites[key] = rewrite.strip()
+
+        save_rewrite_cache(cache_key, new_rewrites, cache_path)
+        model_cache.update(new_rewrites)
+
+    rewritten_queries = defaultdict(str)
+    for qid, history in histories.items():
+        rewritten_queries[qid] = model_cache[history_hash(history)] or queries[qid]
+    return rewritten_queries
@@ -0,0 +1,111 @@
+"""Measures CLI startup time so that slow top-level imports show up.
+
+Usage:
+
+    python treccast/scripts/benchmark_startup.py [--runs 5] [--max-seconds 2.0]
+
+Exits with a non-zero status if the median startup time exceeds the limit,
+or if any of the heavy modules is imported just to print --help.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = [
+    'torch',
+    'transformers',
+    'sentence_transformers',
+    'datasets',
+    'pandas',
+    'spacy',
+    'ir_measures',
+]
+
+TRECCAST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(TRECCAST_DIR)
+
+# (command, working directory) matching how each entry point is launched
+COMMANDS = {
+    'main --help': ([sys.executable, 'main.py', '--help'], TRECCAST_DIR),
+    'indexer --help': (
+        [sys.executable, '-m', 'treccast.indexer.indexer', '--help'],
+        REPO_DIR
+    ),
+}
+
+
+def time_command(command, cwd, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            command,
+            cwd=cwd,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def imported_heavy_modules(command, cwd):
+    """Returns heavy top-level modules imported by the command, using
+    python -X importtime."""
+    result = subprocess.run(
+        [command[0], '-X', 'importtime'] + command[1:],
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        module = line.split('|')[-1].strip()
+        if module in HEAVY_MODULES:
+            imported.add(module)
+    return sorted(imported)
+
+
+def main(args):
+    ok = True
+    for name, (command, cwd) in COMMANDS.items():
+        try:
+            median = time_command(command, cwd, args.runs)
+            heavy = imported_heavy_modules(command, cwd)
+        except subprocess.CalledProcessError as e:
+            ok = False
+            stderr = (e.stderr or '').strip().splitlines()
+            print(f'[FAIL] {name}: exited with status {e.returncode}'
+                  + (f', {stderr[-1]}' if stderr else ''))
+            continue
+        passed = median <= args.max_seconds and not heavy
+        ok = ok and passed
+        print(f'[{"OK" if passed else "FAIL"}] {name}: {median:.3f}s median '
+              f'over {args.runs} runs'
+              + (f', imports {", ".join(heavy)}' if heavy else ''))
+    return ok
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='benchmark_startup.py')
+    parser.add_argument(
+        '-r', '--runs', type=int, default=5,
+        help='Number of runs per command. Defaults to 5.'
+    )
+    parser.add_argument(
+        '-m', '--max-seconds', type=float, default=2.0,
+        help='Maximum median startup time in seconds. Defaults to 2.0.'
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main(parse_args()) else 1)
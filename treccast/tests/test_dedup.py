@@ -0,0 +1,45 @@
+from dedup.dedup import collapse_duplicates, expand_duplicates
+
+DOCS = {
+    '1': 'Caffeine is a central nervous system stimulant of the methylxanthine '
+         'class and is the most widely consumed psychoactive drug in the world.',
+    '2': 'A typical cup of brewed coffee contains between 80 and 100 milligrams '
+         'of caffeine, while a shot of espresso has about 63 milligrams.',
+    '3': 'Caffeine blocks adenosine receptors in the brain, which reduces '
+         'drowsiness and increases alertness for several hours after intake.',
+    '4': 'The half-life of caffeine in healthy adults is about five hours, but '
+         'it is longer during pregnancy and in people with liver disease.',
+    '5': 'Green tea has less caffeine than coffee and also contains L-theanine, '
+         'an amino acid that may promote relaxation without drowsiness.',
+    '6': 'Too much caffeine can cause insomnia, nervousness, restlessness, '
+         'stomach irritation, nausea and a fast heartbeat in some people.',
+    # Copies of 1 and 3 differing in case, punctuation and stopwords only
+    '1a': 'caffeine is a central nervous system stimulant of the methylxanthine '
+          'class, and it is the most widely consumed psychoactive drug in the world',
+    '3a': 'Caffeine blocks adenosine receptors in the brain which reduces '
+          'drowsiness and increases alertness for several hours after the intake!',
+}
+
+RANKING = {'1_1': {'1': 8, '2': 7, '3': 6, '1a': 5, '4': 4, '5': 3, '3a': 2, '6': 1}}
+
+
+def test_collapse_keeps_copies_together_and_distinct_apart():
+    collapsed, clusters, saved_pairs = collapse_duplicates(RANKING, DOCS)
+
+    assert list(collapsed['1_1']) == ['1', '2', '3', '4', '5', '6']
+    assert clusters['1_1'] == {
+        '1': ['1a'], '2': [], '3': ['3a'], '4': [], '5': [], '6': []}
+    assert saved_pairs == {'1_1': 2}
+
+
+def test_expand_propagate_and_demote():
+    _, clusters, _ = collapse_duplicates(RANKING, DOCS)
+    reranked = {'1_1': {'3': 2.0, '1': 1.5, '2': 1.0, '4': 0.5, '5': 0.0, '6': -1.0}}
+
+    propagated = expand_duplicates(reranked, clusters, mode='propagate')
+    assert list(propagated['1_1']) == ['3', '3a', '1', '1a', '2', '4', '5', '6']
+    assert propagated['1_1']['3a'] == 2.0
+
+    demoted = expand_duplicates(reranked, clusters, mode='demote')
+    assert list(demoted['1_1']) == ['3', '1', '2', '4', '5', '6', '3a', '1a']
+    assert max(demoted['1_1']['3a'], demoted['1_1']['1a']) < -1.0